@@ -1,6 +1,10 @@
 __version__ = '0.1'
 
+from .admission import AdmissionController
 from .app import App
+from .executor import Executor
+from .ratelimit import RateLimit
+from .replay import Recorder
 from .response import HTTPError, HTTPResponse
 
 app = App()
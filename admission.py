@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import threading
+
+from .request import HTTPRequest
+from .response import HTTPError
+from .route import Route
+
+class AdmissionController:
+    ''' WSGI wrapper that limits the number of requests handled at once.
+        :app: The WSGI application to protect (usually an App instance).
+        :limit: Maximum number of requests in flight (default: 8).
+        :queue: Maximum number of requests waiting for a free slot. When the
+            queue is full, new requests are rejected immediately unless they
+            have a higher priority than the lowest waiting one (default: 64).
+        :timeout: Seconds a request may wait in the queue (default: 1.0).
+        :retry_after: Value of the "Retry-After" header sent with 503.
+        :priorities: Dict of route pattern -> priority. Waiting requests with
+            a higher priority are admitted first (default priority: 0).
+
+        Usage: wsgi_app = AdmissionController(app, limit=16, priorities={
+            '/health': 10})
+    '''
+    def __init__(self, app, limit=8, queue=64, timeout=1.0, retry_after=1,
+                 priorities=None):
+        assert limit > 0, 'Limit must be positive'
+        self.app = app
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.priorities = []
+        for pattern, priority in (priorities or {}).items():
+            self.priorities.append((Route(pattern), priority))
+        self.inflight = 0
+        self.rejected = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # Heap of [-priority, seq, event, state], where state is None while
+        # waiting, True when admitted and False when shed.
+        self._waiters = []
+
+    def __call__(self, environ, start_response):
+        if not self.acquire(self.priority(environ)):
+            r = HTTPError('Service Unavailable', 503)
+            r.headers['Retry-After'] = str(self.retry_after)
+            start_response(r.status, list(r.headers.items()))
+            return r.body
+        try:
+            body = self.app(environ, start_response)
+        except:
+            self.release()
+            raise
+        return ClosingIterator(body, self.release)
+
+    @property
+    def queued(self):
+        ''' Number of requests currently waiting for a free slot. '''
+        return len(self._waiters)
+
+    def acquire(self, priority=0):
+        ''' Take a slot, waiting in the queue if necessary. Returns False if
+        the request was shed or its deadline has passed. '''
+        with self._lock:
+            if self.inflight < self.limit and not self._waiters:
+                self.inflight += 1
+                return True
+            if len(self._waiters) >= self.queue:
+                lowest = max(self._waiters) if self._waiters else None
+                if lowest is None or -lowest[0] >= priority:
+                    self.rejected += 1
+                    return False
+                self._waiters.remove(lowest)
+                heapq.heapify(self._waiters)
+                lowest[3] = False
+                lowest[2].set()
+                self.rejected += 1
+            waiter = [-priority, next(self._counter), threading.Event(), None]
+            heapq.heappush(self._waiters, waiter)
+        waiter[2].wait(self.timeout)
+        with self._lock:
+            if waiter[3] is None:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self.rejected += 1
+                return False
+            return waiter[3]
+
+    def priority(self, environ):
+        path = HTTPRequest(environ).path
+        for route, priority in self.priorities:
+            if route.match(path):
+                return priority
+        return 0
+
+    def release(self):
+        ''' Free a slot, handing it over to the first waiting request. '''
+        with self._lock:
+            if self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                waiter[3] = True
+                waiter[2].set()
+            else:
+                self.inflight -= 1
+
+    def stats(self):
+        ''' Current counters as a dict (useful for autoscaling metrics). '''
+        return {'inflight': self.inflight, 'queued': self.queued,
+                'limit': self.limit, 'rejected': self.rejected}
+
+class ClosingIterator:
+    ''' Wraps a WSGI response body and calls "callback" once it is closed. '''
+    def __init__(self, body, callback):
+        self.body = body
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            callback, self.callback = self.callback, None
+            if callback:
+                callback()
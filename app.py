@@ -1,6 +1,7 @@
 __version__ = '0.1'
 
 import functools
+import hashlib
 import http.cookies
 import traceback
 
@@ -10,11 +11,13 @@ from .route import Route
 from .utils import MultiDict
 
 class App:
-    def __init__(self):
+    def __init__(self, etag=False):
         self.GET = MultiDict()
         self.POST = MultiDict()
         self.FILES = {}
         self.COOKIES = {}
+        # If True, answer conditional and HEAD requests (see conditional)
+        self.etag = etag
         self.cookies = http.cookies.SimpleCookie()
         self.plugins = Plugins()
         self.request = HTTPRequest()
@@ -27,12 +30,16 @@ class App:
         self.COOKIES.clear()
         self.cookies.clear()
         self.request.bind(environ)
-        self.COOKIES.update(self.request.COOKIES)
-        self.GET.update(self.request.GET)
-        self.POST.update(self.request.POST)
-        self.FILES.update(self.request.FILES)
         try:
             try:
+                # Plugins may reject the request before its body is parsed.
+                for plugin in self.plugins:
+                    if hasattr(plugin, 'before'):
+                        plugin.before(self.request)
+                self.COOKIES.update(self.request.COOKIES)
+                self.GET.update(self.request.GET)
+                self.POST.update(self.request.POST)
+                self.FILES.update(self.request.FILES)
                 for route in self.routes:
                     if route.match(self.request.path):
                         output = route()
@@ -47,6 +54,8 @@ class App:
                 environ['wsgi.errors'].write(traceback.format_exc())
                 raise HTTPError()
         except HTTPResponse as r:
+            if self.etag:
+                self.conditional(r)
             headers = []
             for k, v in r.headers.items():
                 headers.append((k, v))
@@ -56,6 +65,45 @@ class App:
             start_response(r.status, headers)
             return r.body
 
+    def conditional(self, r):
+        ''' Add a hash-based ETag to buffered 200 responses (handlers may set
+        their own for streamed ones), turn the response into 304 if it matches
+        "If-None-Match" and drop the body of HEAD responses without iterating
+        it. Streamed HEAD responses keep their body unless the handler sets
+        Content-Length, since the length cannot be known without iterating.
+        Called for every response when App.etag is True. '''
+        method = self.request.method
+        if method not in ('GET', 'HEAD'):
+            return
+        etag = _header_key(r.headers, 'ETag')
+        # No Content-Length for 1xx, 204 and 304 (RFC 9110, 8.6).
+        bodiless = r.code < 200 or r.code in (204, 304)
+        if isinstance(r.body, (list, tuple)) and all(
+                isinstance(part, (bytes, bytearray)) for part in r.body):
+            if not bodiless and not _header_key(r.headers, 'Content-Length'):
+                r.headers['Content-Length'] = str(sum(map(len, r.body)))
+            if r.code == 200 and not etag:
+                digest = hashlib.blake2b(digest_size=16)
+                for part in r.body:
+                    digest.update(part)
+                etag = 'ETag'
+                r.headers[etag] = '"{}"'.format(digest.hexdigest())
+        if r.code == 200 and etag:
+            etags = self.request.get('HTTP_IF_NONE_MATCH', '')
+            etags = [e.strip() for e in etags.split(',')]
+            value = _strip_weak(r.headers[etag])
+            if '*' in etags or value in map(_strip_weak, etags):
+                r.code = 304
+                for key in list(r.headers):
+                    if key.lower() in ('content-length', 'content-type'):
+                        del r.headers[key]
+        if method == 'HEAD':
+            sized = bodiless or _header_key(r.headers, 'Content-Length')
+        if r.code == 304 or (method == 'HEAD' and sized):
+            if hasattr(r.body, 'close'):
+                r.body.close()
+            r.body = []
+
     def delcookie(self, key, path='/', domain=None):
         self.setcookie(key, max_age=0, path=path, domain=domain,
                        expires='Thu, 01-Jan-1970 00:00:00 GMT')
@@ -95,12 +143,17 @@ class App:
             raise HTTPResponse(body, code, headers)
     '''
 
-    def route(self, path, callback=None):
+    def route(self, path, callback=None, executor=None):
+        ''' Register a callback for the path pattern. If "executor" is given,
+        the callback runs in that Executor pool and receives a snapshot of
+        the request as its first argument. '''
         for route in self.routes:
             if route.pattern == path:
                 raise ValueError('Duplicate route("{}", {})'.format(path, route.callback.__module__))
         def decorator(callback):
             original = callback
+            if executor is not None:
+                callback = executor.wrap(callback, self.request)
             for plugin in self.plugins:
                 if hasattr(plugin, 'apply'):
                     callback = plugin.apply(callback)
@@ -153,3 +206,13 @@ class Plugins:
 
     def __iter__(self):
         return iter(self.plugins)
+
+def _header_key(headers, name):
+    ''' The key of header "name" in the dict, ignoring case (or None). '''
+    name = name.lower()
+    for key in headers:
+        if key.lower() == name:
+            return key
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
@@ -0,0 +1,97 @@
+import concurrent.futures
+import functools
+import threading
+
+from io import BytesIO
+
+from .request import HTTPRequest
+from .response import HTTPError
+
+class Executor:
+    ''' A managed pool for CPU-bound or blocking route callbacks.
+        :workers: Number of worker threads or processes (default: 4).
+        :queue: Maximum number of calls waiting for a free worker. Calls over
+            the limit are rejected with 503 (default: 16).
+        :timeout: Seconds to wait for a result before giving up with 504
+            (default: None, wait forever).
+        :processes: If True, use a process pool instead of a thread pool.
+            Callbacks, captured values and results must then be picklable
+            (default: False). The whole request body is then read into
+            memory and pickled to the worker, which parses form data again,
+            so each call holds up to two extra copies of the body. Prefer
+            threads for routes that receive large uploads.
+        :retry_after: Value of the "Retry-After" header sent with 503.
+
+        Usage: pool = Executor(workers=2)
+               @route('/report/(\\d+)', executor=pool)
+               def report(request, report_id): ...
+
+        The callback receives a snapshot of the request (see
+        HTTPRequest.snapshot) followed by the values captured by the route.
+        HTTPResponse and HTTPError raised in the worker are re-raised as is.
+    '''
+    def __init__(self, workers=4, queue=16, timeout=None, processes=False,
+                 retry_after=1):
+        self.workers = workers
+        self.queue = queue
+        self.timeout = timeout
+        self.processes = processes
+        self.retry_after = retry_after
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    @property
+    def pool(self):
+        ''' The underlying pool, started on first use. '''
+        with self._lock:
+            if self._pool is None:
+                if self.processes:
+                    cls = concurrent.futures.ProcessPoolExecutor
+                else:
+                    cls = concurrent.futures.ThreadPoolExecutor
+                self._pool = cls(max_workers=self.workers)
+            return self._pool
+
+    def call(self, callback, request, *values):
+        ''' Run "callback(snapshot, *values)" in the pool and return its
+        result. '''
+        if not self._slots.acquire(blocking=False):
+            r = HTTPError('Service Unavailable', 503)
+            r.headers['Retry-After'] = str(self.retry_after)
+            raise r
+        try:
+            snapshot = request.snapshot()
+            if self.processes:
+                # Temporary files cannot be pickled, so send the body as bytes.
+                environ = dict(snapshot.environ)
+                environ['wsgi.input'] = BytesIO(environ['wsgi.input'].read())
+                future = self.pool.submit(_run, callback, environ, values)
+            else:
+                # Threads share memory, so the snapshot is passed as is.
+                future = self.pool.submit(callback, snapshot, *values)
+        except:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise HTTPError('Gateway Timeout', 504)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+    def wrap(self, callback, request):
+        ''' Return a route callback that offloads "callback" to the pool. '''
+        @functools.wraps(callback)
+        def wrapper(*values):
+            return self.call(callback, request, *values)
+        return wrapper
+
+def _run(callback, environ, values):
+    return callback(HTTPRequest(environ), *values)
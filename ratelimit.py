@@ -0,0 +1,132 @@
+import array
+import hashlib
+import math
+import threading
+import time
+
+from .response import HTTPError
+from .route import Route
+
+class RateLimit:
+    ''' Rate limit plugin, checked before the request body is parsed.
+        :rate: Requests allowed per client every "per" seconds for all routes
+            (default: None, only the limits added with limit() apply).
+        :per: Length of the rate period in seconds (default: 1.0).
+        :burst: Requests allowed at once (default: same as rate).
+        :header: Identify clients by this request header (e.g. "X-Api-Key").
+        :cookie: Identify clients by this cookie (e.g. "session").
+        :key: Callable(request) returning the client key, overrides the
+            header and cookie options.
+        :trusted: IPs of trusted proxies. "X-Forwarded-For" is only taken
+            into account when the request comes from one of them.
+        :max_keys: Maximum number of tracked keys (default: 1048576).
+
+        Usage: install('ratelimit', RateLimit(100, 60, trusted=['10.0.0.1']))
+               plugins.ratelimit.limit('/login', 5, 60)
+
+        Each bucket is stored as a single float, the time at which it will be
+        full again (GCRA), next to a 64-bit blake2b hash of its key. Both live
+        in preallocated arrays, so the table costs 16 bytes per key (16 MB
+        for the default max_keys) and never grows. A key can only go to one
+        of WAYS slots; when they are all taken, the bucket that will be full
+        soonest (the most idle one) is evicted.
+    '''
+    WAYS = 4
+
+    def __init__(self, rate=None, per=1.0, burst=None, header=None,
+                 cookie=None, key=None, trusted=(), max_keys=2**20):
+        self.header = header
+        self.cookie = cookie
+        self.key = key
+        self.trusted = frozenset(trusted)
+        self.max_keys = max_keys
+        self.limits = []
+        self._sets = max(1, max_keys // self.WAYS)
+        size = self._sets * self.WAYS
+        self._keys = array.array('Q', bytes(8 * size))
+        self._tats = array.array('d', bytes(8 * size))
+        self._lock = threading.Lock()
+        if rate:
+            self.limit(None, rate, per, burst)
+
+    def __len__(self):
+        ''' Number of slots in use. '''
+        return len(self._keys) - self._keys.count(0)
+
+    def before(self, request):
+        path = request.path
+        client = self.client(request).encode('utf-8', 'surrogateescape')
+        now = time.monotonic()
+        with self._lock:
+            for route, interval, burst, person in self.limits:
+                if route is not None and not route.match(path):
+                    continue
+                wait = self.consume(_hash(client, person), interval, burst, now)
+                if wait > 0:
+                    r = HTTPError('Too Many Requests', 429)
+                    r.headers['Retry-After'] = str(math.ceil(wait))
+                    r.headers['X-RateLimit-Limit'] = str(burst)
+                    r.headers['X-RateLimit-Remaining'] = '0'
+                    r.headers['X-RateLimit-Reset'] = str(math.ceil(wait))
+                    raise r
+
+    def client(self, request):
+        ''' The key identifying the client of the request, prefixed with its
+        source so that e.g. a header value cannot pose as an IP address. '''
+        if self.key:
+            return 'k:' + str(self.key(request))
+        if self.header:
+            name = 'HTTP_' + self.header.upper().replace('-', '_')
+            value = request.environ.get(name)
+            if value:
+                return 'h:' + value
+        if self.cookie:
+            value = request.COOKIES.get(self.cookie)
+            if value:
+                return 'c:' + value
+        addr = request.environ.get('REMOTE_ADDR')
+        if addr in self.trusted:
+            # Walk the proxy chain backwards up to the first untrusted IP.
+            for ip in reversed(request.remote_route):
+                addr = ip
+                if ip not in self.trusted:
+                    break
+        return 'ip:' + (addr or '')
+
+    def consume(self, key, interval, burst, now):
+        ''' Take one token from the bucket. Returns 0 on success, otherwise
+        the number of seconds until the next token is available.
+            "key": Non-zero 64-bit integer hash of the client key. '''
+        keys, tats = self._keys, self._tats
+        start = (key % self._sets) * self.WAYS
+        slot = start
+        for i in range(start, start + self.WAYS):
+            if keys[i] == key:
+                slot = i
+                break
+            if tats[i] < tats[slot]:
+                slot = i
+        else:
+            keys[slot] = key
+            tats[slot] = 0.0
+        tat = max(tats[slot], now) + interval
+        wait = tat - now - burst * interval
+        if wait > 0:
+            return wait
+        tats[slot] = tat
+        return 0
+
+    def limit(self, pattern, rate, per=1.0, burst=None):
+        ''' Add a limit of "rate" requests every "per" seconds for the routes
+        matching "pattern" (None matches all routes). '''
+        assert rate > 0, 'Rate must be positive'
+        burst = rate if burst is None else burst
+        route = Route(pattern) if pattern is not None else None
+        # Every limit hashes the client key with its own salt, so all limits
+        # can share the same table.
+        person = str(len(self.limits)).encode()
+        self.limits.append((route, per / rate, burst, person))
+
+def _hash(key, person):
+    digest = hashlib.blake2b(key, digest_size=8, person=person).digest()
+    return int.from_bytes(digest, 'big') or 1
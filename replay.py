@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import random
+import struct
+import threading
+import time
+import traceback
+import urllib.parse
+
+from .request import HTTPRequest
+
+HEADER = struct.Struct('>II')
+REDACTED = 'REDACTED'
+
+class Recorder:
+    ''' WSGI wrapper that appends a sample of requests to a capture file.
+        :app: The WSGI application to record (usually an App instance).
+        :filepath: Capture file, created if missing and only appended to.
+        :sample: Fraction of requests to record (default: 1.0).
+        :max_body: Requests with a larger body are not recorded.
+        :redact_headers: Headers ("X-Api-Key") or environ keys
+            ("HTTP_X_API_KEY") whose values are replaced by REDACTED.
+        :redact_fields: Query string, urlencoded form and JSON fields (at any
+            depth, case-insensitive) whose values are replaced by REDACTED.
+            They are also redacted from the query of URL_HEADERS.
+
+        Each record is two big-endian uint32 lengths followed by the environ
+        subset as JSON and the request body. Multipart and chunked requests
+        are not recorded. Bodies of any other content type, or that cannot be
+        parsed, are recorded empty. Use replay() to play the file back.
+    '''
+    KEYS = ('REQUEST_METHOD', 'SCRIPT_NAME', 'PATH_INFO', 'QUERY_STRING',
+            'CONTENT_TYPE', 'CONTENT_LENGTH', 'SERVER_NAME', 'SERVER_PORT',
+            'SERVER_PROTOCOL', 'REMOTE_ADDR', 'wsgi.url_scheme')
+    REDACT_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_COOKIE',
+                      'HTTP_PROXY_AUTHORIZATION', 'HTTP_X_API_KEY',
+                      'HTTP_X_AUTH_TOKEN', 'HTTP_X_CSRF_TOKEN',
+                      'HTTP_X_CSRFTOKEN', 'HTTP_X_XSRF_TOKEN')
+    URL_HEADERS = ('HTTP_REFERER', 'HTTP_X_ORIGINAL_URL')
+    REDACT_FIELDS = ('password', 'passwd', 'secret', 'token', 'api_key',
+                     'csrf_token')
+
+    def __init__(self, app, filepath, sample=1.0, max_body=HTTPRequest.MEMFILE_MAX,
+                 redact_headers=REDACT_HEADERS, redact_fields=REDACT_FIELDS):
+        self.app = app
+        self.filepath = filepath
+        self.sample = sample
+        self.max_body = max_body
+        self.redact_headers = frozenset(map(self.environ_key, redact_headers))
+        self.redact_fields = frozenset(f.lower() for f in redact_fields)
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if self.sample >= 1 or random.random() < self.sample:
+            try:
+                self.record(environ)
+            except Exception:
+                environ['wsgi.errors'].write(traceback.format_exc())
+        return self.app(environ, start_response)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def environ_key(self, name):
+        ''' Convert a header name to its environ key ("X-Api-Key" to
+        "HTTP_X_API_KEY"). Environ keys are returned unchanged. '''
+        if name in self.KEYS or name.startswith('HTTP_'):
+            return name
+        key = name.upper().replace('-', '_')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            return key
+        return 'HTTP_' + key
+
+    def record(self, environ):
+        ''' Append the request to the capture file. '''
+        request = HTTPRequest(environ)
+        if request.is_chunked or request.content_length > self.max_body:
+            return
+        if request.content_type.startswith('multipart/'):
+            return
+        env = {'capture.time': time.time()}
+        for key, val in environ.items():
+            if key in self.KEYS or key.startswith('HTTP_'):
+                env[key] = REDACTED if key in self.redact_headers else val
+        if env.get('QUERY_STRING'):
+            env['QUERY_STRING'] = self.redact(env['QUERY_STRING'])
+        for key in self.URL_HEADERS:
+            if env.get(key) and env[key] != REDACTED:
+                url = urllib.parse.urlsplit(env[key])
+                if url.query:
+                    env[key] = url._replace(query=self.redact(url.query)).geturl()
+        body = request._body
+        offset = body.tell()
+        body.seek(0)
+        data = body.read()
+        body.seek(offset)
+        if data:
+            data = self.redact_body(data, request.content_type)
+        env['CONTENT_LENGTH'] = str(len(data))
+        meta = json.dumps(env, separators=(',', ':')).encode()
+        self.write(HEADER.pack(len(meta), len(data)) + meta + data)
+
+    def redact(self, query):
+        ''' Replace the values of sensitive fields in an urlencoded string. '''
+        fields = urllib.parse.parse_qsl(query, keep_blank_values=True)
+        if not any(key.lower() in self.redact_fields for key, val in fields):
+            return query
+        fields = [(key, REDACTED if key.lower() in self.redact_fields else val)
+                  for key, val in fields]
+        return urllib.parse.urlencode(fields)
+
+    def redact_body(self, data, content_type):
+        ''' Redact an urlencoded or JSON body. Returns b'' for any other
+        content type or if the body cannot be parsed. '''
+        mimetype = content_type.split(';')[0].strip()
+        if mimetype == 'application/x-www-form-urlencoded':
+            return self.redact(data.decode('latin1')).encode('latin1')
+        if mimetype == 'application/json' or mimetype.endswith('+json'):
+            try:
+                value = json.loads(data.decode('utf-8'))
+            except ValueError:
+                return b''
+            value = self.redact_json(value)
+            return json.dumps(value, separators=(',', ':')).encode()
+        return b''
+
+    def redact_json(self, value):
+        ''' Replace the values of sensitive keys in decoded JSON. '''
+        if isinstance(value, dict):
+            return {key: REDACTED if key.lower() in self.redact_fields
+                    else self.redact_json(val) for key, val in value.items()}
+        if isinstance(value, list):
+            return [self.redact_json(val) for val in value]
+        return value
+
+    def write(self, data):
+        # A single write() on an O_APPEND file keeps records from several
+        # processes from interleaving.
+        with self._lock:
+            if self._fd is None:
+                flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+                self._fd = os.open(self.filepath, flags, 0o600)
+            os.write(self._fd, data)
+
+class Report:
+    ''' Timings and error counts per route, collected by replay(). '''
+    def __init__(self):
+        self.routes = {}
+        self.errors = {}
+
+    def __str__(self):
+        lines = ['{:<32} {:>7} {:>7} {:>9} {:>9} {:>9}'.format(
+            'route', 'count', 'errors', 'mean ms', 'p95 ms', 'max ms')]
+        for name, times in sorted(self.routes.items()):
+            times = sorted(times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            lines.append('{:<32} {:>7} {:>7} {:>9.3f} {:>9.3f} {:>9.3f}'.format(
+                name, len(times), self.errors.get(name, 0),
+                sum(times) / len(times) * 1000, p95 * 1000, times[-1] * 1000))
+        return '\n'.join(lines)
+
+    def add(self, name, duration, error=False):
+        self.routes.setdefault(name, []).append(duration)
+        if error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+def read(filepath):
+    ''' Yield (environ, body) pairs from a capture file. '''
+    with open(filepath, 'rb') as fp:
+        while True:
+            header = fp.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            meta_len, body_len = HEADER.unpack(header)
+            meta = fp.read(meta_len)
+            body = fp.read(body_len)
+            if len(meta) < meta_len or len(body) < body_len:
+                break # Truncated last record
+            yield json.loads(meta.decode()), body
+
+def replay(app, filepath, repeat=1, errors=None):
+    ''' Play a capture file back against a WSGI application as fast as
+    possible and return a Report. Responses with status 500 or higher and
+    uncaught exceptions count as errors.
+        :app: The WSGI application (usually an App instance).
+        :filepath: Capture file written by Recorder.
+        :repeat: Number of times to play the file (default: 1).
+        :errors: Stream for "wsgi.errors" (default: discarded).
+    '''
+    records = list(read(filepath))
+    errors = errors or io.StringIO()
+    report = Report()
+    for _ in range(repeat):
+        for env, body in records:
+            environ = dict(env)
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['wsgi.errors'] = errors
+            name = _route_name(app, environ)
+            status = []
+            start = time.perf_counter()
+            try:
+                result = app(environ, lambda s, h, exc_info=None: status.append(s))
+                try:
+                    for _ in result:
+                        pass
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+                error = not status or int(status[-1][:3]) >= 500
+            except Exception:
+                errors.write(traceback.format_exc())
+                error = True
+            report.add(name, time.perf_counter() - start, error)
+    return report
+
+def _route_name(app, environ):
+    path = HTTPRequest(dict(environ)).path
+    # Look through wrappers such as Recorder or AdmissionController.
+    while not hasattr(app, 'routes') and hasattr(app, 'app'):
+        app = app.app
+    if not hasattr(app, 'routes'):
+        return path
+    for route in app.routes:
+        if route.match(path):
+            return route.raw_pattern
+    return '(no route)'
@@ -325,6 +325,38 @@ class HTTPRequest:
         remote = self.environ.get('REMOTE_ADDR')
         return [remote] if remote else []
 
+    def snapshot(self):
+        ''' A detached copy of the request that is safe to hand over to a
+        worker thread or process. Only plain environ values are copied and
+        the request body is copied into a new "wsgi.input" (a memory buffer
+        or, above MEMFILE_MAX, a temporary file, same as self._body). '''
+        environ = {}
+        for key, val in self.environ.items():
+            if key.startswith('request.') or key in ('wsgi.input', 'wsgi.errors'):
+                continue
+            if isinstance(val, (str, bytes, int, float, bool, tuple)):
+                environ[key] = val
+        body, copy, body_size, is_temp_file = self._body, BytesIO(), 0, False
+        offset = body.tell()
+        body.seek(0)
+        while True:
+            part = body.read(self.MEMFILE_MAX)
+            if not part:
+                break
+            body_size += len(part)
+            if not is_temp_file and body_size > self.MEMFILE_MAX:
+                copy, mem = TemporaryFile(mode='w+b'), copy
+                copy.write(mem.getvalue())
+                is_temp_file = True
+                del mem
+            copy.write(part)
+        body.seek(offset)
+        copy.seek(0)
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+        environ['CONTENT_LENGTH'] = str(body_size)
+        environ['wsgi.input'] = copy
+        return self.__class__(environ)
+
     @CachedToEnviron
     def url(self):
         ''' The relative URL. '''